@@ -0,0 +1,240 @@
+"""Measure build loop memory and compare the records with the old dicts.
+
+Usage: python benchmarks/build_memory.py [--songs N]
+
+Runs add_to_playlist over a synthetic N-song VocaDB list (songs are taken
+from the checked-in Hall Of Myths response) against an offline YouTube
+stand-in and a temporary SQLite database, and reports traced memory after
+each page of 50 songs. The build loop only holds one page at a time, as it
+did before the records were added, so this shows that memory stays flat
+rather than how much the records save.
+
+The savings are measured afterwards: the memory kept alive by the data the
+app holds (a list page, a song response, video candidates and the N review
+rows) is traced once in the old dict form and once as records.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["WARM_UP"] = "0"
+
+import db
+import vocaloid_playlist_creator as app
+from records import SongRow, VideoCandidate
+
+FIXTURE = os.path.join(ROOT, "Hall Of Myths Songs Response.json")
+PAGE_SIZE = 50
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        # Every call decodes a fresh body, like a real response
+        return json.loads(self.data)
+
+
+class FakeVocaDB:
+    def __init__(self, total_songs):
+        with open(FIXTURE, encoding="utf-8-sig") as f:
+            self.songs = [item["song"] for item in json.load(f)["items"]]
+        self.total_songs = total_songs
+
+    def get(self, url, params=None, timeout=None):
+        if "/songLists/" in url:
+            start = params["start"]
+            items = [
+                {"order": order + 1, "song": self.songs[order % len(self.songs)]}
+                for order in range(start, min(start + PAGE_SIZE, self.total_songs))
+            ]
+            return FakeResponse(
+                json.dumps({"items": items, "totalCount": self.total_songs})
+            )
+
+        song_id = int(url.rsplit("/", 1)[-1])
+        song = next(song for song in self.songs if song["id"] == song_id)
+        pvs = [
+            {
+                "service": "Youtube",
+                "pvType": "Original",
+                "url": f"https://www.youtube.com/watch?v={song_id:011d}",
+            }
+        ]
+        return FakeResponse(json.dumps({**song, "pvs": pvs}))
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+class FakeYouTube:
+    def videos(self):
+        return self
+
+    def playlistItems(self):
+        return self
+
+    def list(self, id, **kwargs):
+        return FakeRequest(
+            {
+                "items": [
+                    {
+                        "id": video_id,
+                        "contentDetails": {"duration": "PT4M6S"},
+                        "statistics": {"viewCount": "1000"},
+                        "snippet": {"title": f"Video {video_id}"},
+                    }
+                    for video_id in id.split(",")
+                ]
+            }
+        )
+
+    def insert(self, **kwargs):
+        return FakeRequest({"id": "item"})
+
+
+def retained(build):
+    """Return the bytes still allocated by what build() returns."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def old_songs_for_review(columns, rows):
+    # What get_songs_for_review returned before SongRow
+    songs = []
+    for row in rows:
+        song = {columns[i]: row[i] for i in range(len(columns))}
+        songs.append({column: song[column] for column in columns})
+    return songs
+
+
+def old_video_details(response):
+    # What get_video_details returned before VideoCandidate
+    return {
+        item["id"]: {
+            "duration": item["contentDetails"]["duration"],
+            "view_count": int(item["statistics"]["viewCount"]),
+            "video_name": item["snippet"]["title"],
+        }
+        for item in response["items"]
+    }
+
+
+def new_video_details(response):
+    return {
+        item["id"]: VideoCandidate(
+            item["id"],
+            app.convert_duration_to_seconds(item["contentDetails"]["duration"]),
+            int(item["statistics"]["viewCount"]),
+            item["snippet"]["title"],
+        )
+        for item in response["items"]
+    }
+
+
+def compare(name, old, new):
+    print(
+        f"{name:32s} dicts {old / 1e3:8.1f} kB, records {new / 1e3:8.1f} kB "
+        f"({1 - new / old:.0%} less)"
+    )
+
+
+def compare_records(vocadb, db_path):
+    print()
+    print("memory held, old dicts vs records:")
+
+    # The old loop kept the decoded page alive while it processed its songs
+    compare(
+        f"list page ({PAGE_SIZE} songs)",
+        retained(lambda: vocadb.get("/songLists/1/songs", {"start": 0}).json()),
+        retained(lambda: app.get_list_page(1, 0, PAGE_SIZE)),
+    )
+
+    song_id = vocadb.songs[0]["id"]
+    compare(
+        "song response",
+        retained(lambda: vocadb.get(f"/songs/{song_id}").json()),
+        retained(lambda: app.get_song_details(song_id)),
+    )
+
+    video_ids = ",".join(
+        f"{number:011d}" for number in range(app.VIDEOS_LIST_BATCH_SIZE)
+    )
+    response = FakeYouTube().list(id=video_ids).execute()
+    compare(
+        f"video details ({app.VIDEOS_LIST_BATCH_SIZE} videos)",
+        retained(lambda: old_video_details(response)),
+        retained(lambda: new_video_details(response)),
+    )
+
+    connection = sqlite3.connect(db_path)
+    cursor = connection.execute(
+        """SELECT songs.id, vocadb_id, songs.playlist_id, song_name, artist_name,
+        youtube_video_id, review_status, original_order, suggested_video_id,
+        playlists.playlist_name
+        FROM songs
+        JOIN playlists ON songs.playlist_id = playlists.playlist_id"""
+    )
+    columns = [column[0] for column in cursor.description]
+    rows = cursor.fetchall()
+    connection.close()
+    compare(
+        f"review rows ({len(rows)} songs)",
+        retained(lambda: old_songs_for_review(columns, rows)),
+        retained(lambda: [SongRow(*row) for row in rows]),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=10_000)
+    args = parser.parse_args()
+
+    vocadb = app.requests = FakeVocaDB(args.songs)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db.configure_backend("sqlite", path=db_path)
+        db.create_tables()
+        db.insert_playlist("BENCH", "Benchmark", "", "BENCH_OWNER")
+
+        tracemalloc.start()
+        pages = 0
+        for number, (success, _) in enumerate(
+            app.add_to_playlist(FakeYouTube(), 1, "BENCH", MAX_RESULTS=PAGE_SIZE), 1
+        ):
+            assert success
+            if number % PAGE_SIZE == 0:
+                pages += 1
+                current, peak = tracemalloc.get_traced_memory()
+                if pages == 1 or pages % 20 == 0:
+                    print(
+                        f"page {pages:4d} ({number:6d} songs): "
+                        f"current {current / 1e3:8.1f} kB, peak {peak / 1e3:8.1f} kB"
+                    )
+                tracemalloc.reset_peak()
+        tracemalloc.stop()
+
+        compare_records(vocadb, db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare per-song write latency of the MySQL and SQLite backends.
+
+Usage: python benchmarks/db_write_latency.py [--songs N] [--skip-mysql]
+
+Writes go to a throwaway playlist id which is deleted afterwards. The MySQL
+run uses the default connection settings from db.py and is skipped if the
+server cannot be reached.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+PLAYLIST_ID = "BENCHMARK_PLAYLIST"
+
+
+def song_rows(count):
+    for order in range(1, count + 1):
+        yield (
+            order,
+            PLAYLIST_ID,
+            f"Song {order}",
+            "Artist",
+            "dQw4w9WgXcQ",
+            True,
+            order,
+        )
+
+
+@db.with_db_connection
+def clear_benchmark_rows(connection, cursor):
+    cursor.execute("DELETE FROM songs WHERE playlist_id = %s", (PLAYLIST_ID,))
+    connection.commit()
+
+
+def run(backend_name, songs, **options):
+    db.configure_backend(backend_name, **options)
+    db.create_tables()
+    clear_benchmark_rows()
+
+    latencies = []
+    for row in song_rows(songs):
+        started = time.perf_counter()
+        db.insert_song(*row)
+        latencies.append(time.perf_counter() - started)
+    clear_benchmark_rows()
+
+    started = time.perf_counter()
+    db.insert_songs(song_rows(songs))
+    batched = time.perf_counter() - started
+    clear_benchmark_rows()
+
+    latencies.sort()
+    print(
+        f"{backend_name:>6}: insert_song median {statistics.median(latencies) * 1e3:.3f} ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1e3:.3f} ms | "
+        f"insert_songs {batched / songs * 1e3:.4f} ms/song"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=1000)
+    parser.add_argument("--skip-mysql", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run("sqlite", args.songs, path=os.path.join(tmp, "bench.db"))
+
+    if not args.skip_mysql:
+        try:
+            run("mysql", args.songs)
+        except Exception as e:
+            print(f" mysql: skipped ({e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Time exporting and restoring a large snapshot.
+
+Usage: python benchmarks/snapshot_restore.py [--songs N]
+
+Songs are seeded from the real VocaDB list response checked into the repo
+(Hall Of Myths Songs Response.json), repeated across playlists until N rows
+exist. Both databases are temporary SQLite files.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db
+import snapshot
+
+FIXTURE = os.path.join(ROOT, "Hall Of Myths Songs Response.json")
+
+
+def seed(songs):
+    with open(FIXTURE, encoding="utf-8-sig") as f:
+        items = json.load(f)["items"]
+
+    db.create_tables()
+    playlists = (songs + len(items) - 1) // len(items)
+    for number in range(playlists):
+        db.insert_playlist(
+            f"BENCH{number}", f"Benchmark {number}", "", "BENCH_OWNER"
+        )
+
+    rows = (
+        (
+            item["song"]["id"],
+            f"BENCH{i // len(items)}",
+            item["song"]["defaultName"],
+            item["song"]["artistString"],
+            "dQw4w9WgXcQ",
+            True,
+            item["order"],
+        )
+        for i, item in ((i, items[i % len(items)]) for i in range(songs))
+    )
+    db.insert_songs(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot.jsonl.gz")
+
+        db.configure_backend("sqlite", path=os.path.join(tmp, "source.db"))
+        seed(args.songs)
+
+        started = time.perf_counter()
+        counts = snapshot.export_snapshot(path)
+        exported = time.perf_counter() - started
+
+        # Second pass under tracemalloc, which is too slow to time with
+        tracemalloc.start()
+        snapshot.export_snapshot(path)
+        _, export_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        db.configure_backend("sqlite", path=os.path.join(tmp, "restored.db"))
+        started = time.perf_counter()
+        snapshot.import_snapshot(path)
+        restored = time.perf_counter() - started
+
+        print(f"rows: {counts}, snapshot size: {os.path.getsize(path) / 1e6:.2f} MB")
+        print(f"export: {exported:.2f} s (peak {export_peak / 1e6:.2f} MB traced)")
+        print(f"import: {restored:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measure cold start: app import time with a breakdown, and warm-up time.
+
+Usage: python benchmarks/startup_time.py [--top N] [--budget-ms MS]
+
+Each measurement runs in a fresh interpreter. The import breakdown comes
+from ``python -X importtime`` and lists the slowest modules imported
+directly by the app's own modules. With --budget-ms the script exits
+non-zero when importing the app takes longer, so regressions fail CI.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_MODULE = "vocaloid_playlist_creator"
+
+
+def run(code, **env):
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env={**os.environ, "WARM_UP": "0", **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def parse_importtime(stderr):
+    """Return [(cumulative_us, depth, module)] from -X importtime output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(cumulative), depth, name.strip()))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float)
+    args = parser.parse_args()
+
+    entries = parse_importtime(run(f"import {APP_MODULE}").stderr)
+    total_us = next(us for us, _, name in entries if name == APP_MODULE)
+
+    # Depth 0 is the app module itself, depth 1 what it imports directly
+    direct = sorted((entry for entry in entries if entry[1] == 1), reverse=True)
+    direct = direct[: args.top]
+    print(f"import {APP_MODULE}: {total_us / 1e3:.1f} ms")
+    for cumulative, _, name in direct:
+        print(f"  {cumulative / 1e3:8.1f} ms  {name}")
+
+    warm_up = run(
+        "import time\n"
+        f"import {APP_MODULE} as app\n"
+        "started = time.perf_counter()\n"
+        "app.get_discovery_document()\n"
+        "app.convert_duration_to_seconds('PT0S')\n"
+        "import importlib\n"
+        "for module in app.WARM_UP_MODULES:\n"
+        "    importlib.import_module(module)\n"
+        "print(time.perf_counter() - started)\n"
+    )
+    print(
+        f"warm-up (client libraries and caches, without database): "
+        f"{float(warm_up.stdout.split()[-1]) * 1e3:.1f} ms"
+    )
+
+    if args.budget_ms is not None and total_us / 1e3 > args.budget_ms:
+        print(f"Import time is over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
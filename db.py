@@ -1,12 +1,168 @@
-from functools import wraps
-import mysql.connector
+from functools import lru_cache, wraps
+import os
+import re
+import sqlite3
+import threading
+import time
 
+from records import SongRow
 
-def get_connection():
-    connection = mysql.connector.connect(
-        host="localhost", user="root", password="tri1999", database="vocaloid_db"
+# Playlist progress is read on every index request but only changes when a
+# build writes to it, so keep a short-lived copy per owner in each process.
+# Writes made by this process invalidate it; writes made by other worker
+# processes can show up to PLAYLIST_INFO_TTL seconds late.
+PLAYLIST_INFO_TTL = 5
+
+# {owner_id: (fetched_at, playlists)}
+_playlist_info_cache = {}
+_playlist_info_lock = threading.Lock()
+
+
+class MySQLBackend:
+    """Pooled connections to a MySQL server.
+
+    The driver is imported and the pool opened on first use in each process,
+    so workers forked after import never share the parent's sockets. When
+    every pooled connection is busy, connect() waits up to ``pool_timeout``
+    seconds for one to be returned instead of opening extra connections.
+    """
+
+    name = "mysql"
+
+    def __init__(
+        self,
+        host="localhost",
+        user="root",
+        password="tri1999",
+        database="vocaloid_db",
+        pool_size=None,
+        pool_timeout=None,
+    ):
+        self.options = {
+            "host": host,
+            "user": user,
+            "password": password,
+            "database": database,
+        }
+        self.pool_size = pool_size or int(os.getenv("DB_POOL_SIZE", 5))
+        if pool_timeout is None:
+            pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", 5))
+        self.pool_timeout = pool_timeout
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def connect(self):
+        import mysql.connector.pooling
+        from mysql.connector.errors import PoolError
+
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name="vocaloid_db", pool_size=self.pool_size, **self.options
+                )
+                self._pool_pid = os.getpid()
+
+        deadline = time.monotonic() + self.pool_timeout
+        while True:
+            try:
+                return self._pool.get_connection()
+            except PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+    def cursor(self, connection):
+        return connection.cursor()
+
+    def release(self, connection):
+        # Returns pooled connections to the pool
+        connection.close()
+
+
+@lru_cache(maxsize=None)
+def _mysql_to_sqlite(query):
+    """Rewrite the MySQL dialect used in this module into SQLite's."""
+    query = query.replace("%s", "?")
+    query = query.replace(
+        "INT AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT"
     )
-    return connection
+    query = query.replace("INSERT IGNORE", "INSERT OR IGNORE")
+    # ON DUPLICATE KEY UPDATE a=VALUES(a) -> ON CONFLICT DO UPDATE SET a=excluded.a
+    head, upsert, tail = query.partition("ON DUPLICATE KEY UPDATE")
+    if upsert:
+        tail = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", tail)
+        query = head + "ON CONFLICT DO UPDATE SET" + tail
+    return query
+
+
+class _SQLiteCursor(sqlite3.Cursor):
+    def execute(self, query, params=()):
+        return super().execute(_mysql_to_sqlite(query), params)
+
+    def executemany(self, query, seq_of_params):
+        return super().executemany(_mysql_to_sqlite(query), seq_of_params)
+
+
+class SQLiteBackend:
+    """Embedded backend for single-node deployments and local development.
+
+    Each thread keeps one open connection so sqlite3's statement cache
+    works as a set of prepared statements across calls. A forked process
+    opens its own instead of reusing the one inherited from its parent.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path="vocaloid.db"):
+        self.path = path
+        self._local = threading.local()
+
+    def connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, cached_statements=256)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # WAL only needs a sync at checkpoints to stay consistent
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def cursor(self, connection):
+        return connection.cursor(_SQLiteCursor)
+
+    def release(self, connection):
+        pass
+
+
+BACKENDS = {"mysql": MySQLBackend, "sqlite": SQLiteBackend}
+
+
+def configure_backend(name, **options):
+    global _backend
+    _backend = BACKENDS[name](**options)
+    invalidate_playlist_info_cache()
+    return _backend
+
+
+def _backend_from_env():
+    name = os.getenv("DB_BACKEND", "mysql")
+    if name == "sqlite":
+        return SQLiteBackend(os.getenv("SQLITE_PATH", "vocaloid.db"))
+    return BACKENDS[name]()
+
+
+_backend = _backend_from_env()
+
+
+def get_connection():
+    return _backend.connect()
+
+
+def warm_up():
+    """Open the connection pool and make sure the tables exist."""
+    create_tables()
 
 
 def with_db_connection(func):
@@ -14,12 +170,17 @@ def with_db_connection(func):
     def wrapper(*args, **kwargs):
         connection = get_connection()
         try:
-            with connection:
-                with connection.cursor() as cursor:
-                    # Pass the cursor and connection to the function
-                    return func(connection, cursor, *args, **kwargs)
+            cursor = _backend.cursor(connection)
+            try:
+                # Pass the cursor and connection to the function
+                return func(connection, cursor, *args, **kwargs)
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
         finally:
-            connection.close()
+            _backend.release(connection)
 
     return wrapper
 
@@ -36,10 +197,15 @@ def create_tables(connection, cursor):
     youtube_video_id VARCHAR(20),
     review_status BOOLEAN DEFAULT FALSE,
     original_order INT,
-    UNIQUE KEY unique_order (playlist_id, original_order)
+    suggested_video_id VARCHAR(20),
+    CONSTRAINT unique_order UNIQUE (playlist_id, original_order)
     )
     """
     cursor.execute(create_table_query)
+
+    # Tables created before the playlist audit existed lack this column
+    _add_missing_column(cursor, "songs", "suggested_video_id", "VARCHAR(20)")
+
     create_table_query = """
     CREATE TABLE IF NOT EXISTS playlists(
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -49,13 +215,38 @@ def create_tables(connection, cursor):
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     current_song_number INT,
     total_song_number INT,
+    owner_id VARCHAR(64),
     UNIQUE (playlist_id)
     )
     """
     cursor.execute(create_table_query)
+
+    # Playlists created before progress was tracked per account have no
+    # owner and stay hidden until claimed with an UPDATE
+    _add_missing_column(cursor, "playlists", "owner_id", "VARCHAR(64)")
+
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS quota_usage(
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    key_id VARCHAR(64) NOT NULL,
+    quota_day VARCHAR(10) NOT NULL,
+    units_used INT NOT NULL DEFAULT 0,
+    exhausted BOOLEAN DEFAULT FALSE,
+    CONSTRAINT unique_key_day UNIQUE (key_id, quota_day)
+    )
+    """
+    cursor.execute(create_table_query)
     connection.commit()
 
 
+def _add_missing_column(cursor, table, column, definition):
+    cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+    cursor.fetchall()
+    columns = [existing[0] for existing in cursor.description]
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
 @with_db_connection
 def insert_song(
     connection,
@@ -86,21 +277,39 @@ def insert_song(
 
 
 @with_db_connection
-def insert_playlist(connection, cursor, playlist_id, playlist_name, description):
+def insert_songs(connection, cursor, songs):
+    """Insert many songs in a single transaction.
+
+    ``songs`` is an iterable of tuples in the same order as the arguments
+    of ``insert_song``.
+    """
     insert_query = """
-    INSERT INTO playlists (playlist_id,playlist_name,description) VALUES (%s,%s,%s)
+    INSERT INTO songs (vocadb_id, playlist_id, song_name, artist_name, youtube_video_id, review_status, original_order)
+    VALUES (%s,%s,%s,%s,%s,%s,%s)
     """
-    values = (playlist_id, playlist_name, description)
-    try:
-        cursor.execute(insert_query, values)
-        connection.commit()
-    except mysql.connector.IntegrityError:
-        pass
+    cursor.executemany(insert_query, list(songs))
+    connection.commit()
+
+
+@with_db_connection
+def insert_playlist(
+    connection, cursor, playlist_id, playlist_name, description, owner_id
+):
+    insert_query = """
+    INSERT IGNORE INTO playlists (playlist_id,playlist_name,description,owner_id)
+    VALUES (%s,%s,%s,%s)
+    """
+    values = (playlist_id, playlist_name, description, owner_id)
+    cursor.execute(insert_query, values)
+    connection.commit()
+    invalidate_playlist_info_cache()
 
 
 @with_db_connection
 def get_songs_for_review(connection, cursor):
-    query = """SELECT songs.*, playlists.playlist_name
+    query = """SELECT songs.id, vocadb_id, songs.playlist_id, song_name, artist_name,
+        youtube_video_id, review_status, original_order, suggested_video_id,
+        playlists.playlist_name
         FROM songs
         JOIN playlists ON songs.playlist_id = playlists.playlist_id
         WHERE review_status = FALSE
@@ -108,37 +317,44 @@ def get_songs_for_review(connection, cursor):
 
     cursor.execute(query)
 
-    # Get column names from cursor.description
-    columns = [column[0] for column in cursor.description]
+    return [SongRow(*row) for row in cursor.fetchall()]
 
-    rows = cursor.fetchall()
 
-    songs = []
-    for row in rows:
-        # Create a dictionary for each row using column names
-        song = {columns[i]: row[i] for i in range(len(columns))}
+@with_db_connection
+def update_song_video(connection, cursor, song_id, youtube_video_id_new):
+    update_query = """UPDATE songs
+        SET youtube_video_id = %s, suggested_video_id = NULL
+        WHERE id = %s"""
+    cursor.execute(update_query, (youtube_video_id_new, song_id))
+    connection.commit()
+    return True
+
+
+@with_db_connection
+def get_playlist_songs(connection, cursor, playlist_id):
+    query = """SELECT id, vocadb_id, playlist_id, song_name, artist_name,
+        youtube_video_id, review_status, original_order, suggested_video_id
+        FROM songs
+        WHERE playlist_id = %s AND youtube_video_id IS NOT NULL
+        ORDER BY original_order ASC"""
 
-        songs.append(
-            {
-                "id": song["id"],
-                "vocadb_id": song["vocadb_id"],
-                "playlist_id": song["playlist_id"],
-                "song_name": song["song_name"],
-                "artist_name": song["artist_name"],
-                "youtube_video_id": song["youtube_video_id"],
-                "review_status": song["review_status"],
-                "original_order": song["original_order"],
-                "playlist_name": song["playlist_name"],
-            }
-        )
+    cursor.execute(query, (playlist_id,))
 
-    return songs
+    return [SongRow(*row) for row in cursor.fetchall()]
 
 
 @with_db_connection
-def update_song_video(connection, cursor, song_id, youtube_video_id_new):
-    update_query = "UPDATE songs SET youtube_video_id = %s WHERE id = %s"
-    cursor.execute(update_query, (youtube_video_id_new, song_id))
+def flag_songs_for_review(connection, cursor, flagged_songs):
+    """Send songs back to the review queue.
+
+    ``flagged_songs`` is an iterable of ``(song_id, suggested_video_id)``
+    pairs; the suggestion may be None.
+    """
+    update_query = (
+        "UPDATE songs SET review_status=FALSE, suggested_video_id=%s WHERE id=%s"
+    )
+    values = [(suggested, song_id) for song_id, suggested in flagged_songs]
+    cursor.executemany(update_query, values)
     connection.commit()
     return True
 
@@ -152,10 +368,12 @@ def mark_song_reviewed(connection, cursor, song_id):
 
 
 @with_db_connection
-def get_playlist_info(connection, cursor):
-    query = "SELECT id,playlist_id,playlist_name,description,current_song_number,total_song_number FROM playlists"
+def _fetch_playlist_info(connection, cursor, owner_id):
+    query = """SELECT id,playlist_id,playlist_name,description,current_song_number,total_song_number
+        FROM playlists
+        WHERE owner_id = %s"""
 
-    cursor.execute(query)
+    cursor.execute(query, (owner_id,))
 
     columns = [column[0] for column in cursor.description]
 
@@ -166,12 +384,41 @@ def get_playlist_info(connection, cursor):
     return playlists
 
 
+def get_playlist_info(owner_id):
+    # Only the cache is locked, so a slow query doesn't hold up other owners
+    with _playlist_info_lock:
+        fetched_at, playlists = _playlist_info_cache.get(owner_id, (0.0, None))
+    if playlists is None or time.monotonic() - fetched_at >= PLAYLIST_INFO_TTL:
+        playlists = _fetch_playlist_info(owner_id)
+        with _playlist_info_lock:
+            _playlist_info_cache[owner_id] = (time.monotonic(), playlists)
+
+    # Hand out copies so callers can't mutate the cached rows
+    return [dict(playlist) for playlist in playlists]
+
+
+@with_db_connection
+def is_playlist_owner(connection, cursor, playlist_id, owner_id):
+    # Authorization reads the database directly; the progress cache may not
+    # have seen a playlist created in another worker yet
+    query = "SELECT 1 FROM playlists WHERE playlist_id = %s AND owner_id = %s"
+    cursor.execute(query, (playlist_id, owner_id))
+    return cursor.fetchone() is not None
+
+
+def invalidate_playlist_info_cache():
+    # Progress writes are keyed by playlist, not owner, so drop every entry
+    with _playlist_info_lock:
+        _playlist_info_cache.clear()
+
+
 @with_db_connection
 def update_total_song_number(connection, cursor, total_song_number, playlist_id):
     update_query = "UPDATE playlists SET total_song_number=%s WHERE playlist_id=%s"
     values = (total_song_number, playlist_id)
     cursor.execute(update_query, values)
     connection.commit()
+    invalidate_playlist_info_cache()
 
     return True
 
@@ -182,5 +429,121 @@ def update_current_song_number(connection, cursor, current_song_number, playlist
     values = (current_song_number, playlist_id)
     cursor.execute(update_query, values)
     connection.commit()
+    invalidate_playlist_info_cache()
 
     return True
+
+
+@with_db_connection
+def get_quota_usage(connection, cursor, quota_day):
+    """Return {key_id: (units_used, exhausted)} for one quota day."""
+    query = "SELECT key_id, units_used, exhausted FROM quota_usage WHERE quota_day=%s"
+    cursor.execute(query, (quota_day,))
+
+    return {
+        key_id: (units_used, bool(exhausted))
+        for key_id, units_used, exhausted in cursor.fetchall()
+    }
+
+
+@with_db_connection
+def add_quota_usage(connection, cursor, key_id, quota_day, units, exhausted=False):
+    insert_query = """
+    INSERT INTO quota_usage (key_id, quota_day, units_used, exhausted) VALUES (%s,%s,%s,%s)
+    ON DUPLICATE KEY UPDATE units_used=units_used+VALUES(units_used), exhausted=exhausted OR VALUES(exhausted)
+    """
+    cursor.execute(insert_query, (key_id, quota_day, units, exhausted))
+    connection.commit()
+
+
+# Columns written to and restored from snapshots, per table
+SNAPSHOT_COLUMNS = {
+    "playlists": (
+        "id",
+        "playlist_id",
+        "playlist_name",
+        "description",
+        "created_at",
+        "current_song_number",
+        "total_song_number",
+        "owner_id",
+    ),
+    "songs": (
+        "id",
+        "vocadb_id",
+        "playlist_id",
+        "song_name",
+        "artist_name",
+        "youtube_video_id",
+        "review_status",
+        "original_order",
+        "suggested_video_id",
+    ),
+}
+
+
+# Natural keys that identify a snapshot row in any database. Surrogate ids
+# differ between environments, so imports match rows on these instead.
+SNAPSHOT_KEYS = {
+    "playlists": ("playlist_id",),
+    "songs": ("playlist_id", "original_order"),
+}
+
+
+@with_db_connection
+def stream_table(connection, cursor, table, callback, batch_size=1000):
+    """Call ``callback`` with each batch of rows of a snapshot table.
+
+    Rows are fetched ``batch_size`` at a time so memory use doesn't grow
+    with the table.
+    """
+    columns = SNAPSHOT_COLUMNS[table]
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id ASC")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        callback(rows)
+
+
+@with_db_connection
+def load_table(connection, cursor, table, rows, batch_size=1000, columns=None):
+    """Bulk insert snapshot rows, updating rows that already exist.
+
+    ``columns`` defaults to every snapshot column of the table; older
+    snapshots may carry a subset. Rows are matched on SNAPSHOT_KEYS and the
+    snapshot's ids are dropped, so local rows keep their own ids and are
+    never overwritten by an unrelated row that happens to share one. With no
+    id in the insert the natural key is the only unique key that can
+    conflict, which keeps ON DUPLICATE KEY UPDATE unambiguous. Each batch
+    goes out as one multi-row insert and the whole load is committed once
+    at the end.
+    """
+    columns = columns or SNAPSHOT_COLUMNS[table]
+    keys = SNAPSHOT_KEYS[table]
+    kept = [index for index, column in enumerate(columns) if column != "id"]
+    columns = [columns[index] for index in kept]
+    updates = ", ".join(
+        f"{column}=VALUES({column})" for column in columns if column not in keys
+    )
+    insert_query = f"""
+    INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})
+    ON DUPLICATE KEY UPDATE {updates}
+    """
+
+    loaded = 0
+    batch = []
+    for row in rows:
+        batch.append(tuple(row[index] for index in kept))
+        if len(batch) >= batch_size:
+            cursor.executemany(insert_query, batch)
+            loaded += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(insert_query, batch)
+        loaded += len(batch)
+    connection.commit()
+
+    if table == "playlists":
+        invalidate_playlist_info_cache()
+    return loaded
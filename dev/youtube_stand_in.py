@@ -0,0 +1,149 @@
+"""Minimal local stand-in for the YouTube Data API v3.
+
+Serves the calls the playlist creator makes (channels, search, videos,
+playlists and playlistItems) with fake data and charges quota per API key, answering
+quotaExceeded once a key runs out. OAuth requests are charged to "owner".
+
+Usage:
+    python dev/youtube_stand_in.py [--port 8765] [--quota 10000]
+    YOUTUBE_API_ENDPOINT=http://localhost:8765/ YOUTUBE_API_KEYS=a,b flask run
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from urllib.parse import parse_qs, urlparse
+
+QUOTA_COSTS = {
+    ("GET", "channels"): 1,
+    ("GET", "search"): 100,
+    ("GET", "videos"): 1,
+    ("GET", "playlistItems"): 1,
+    ("POST", "playlists"): 50,
+    ("POST", "playlistItems"): 50,
+    ("DELETE", "playlistItems"): 50,
+}
+
+usage = {}
+playlists = {}
+
+# Channel id returned for the signed-in account
+STAND_IN_CHANNEL_ID = "UCstandin0000000000000000"
+
+
+def fake_video_id(seed):
+    return f"{abs(hash(seed)) % 10**11:011d}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    daily_quota = 10000
+
+    def _send(self, status, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        resource = url.path.rstrip("/").rsplit("/", 1)[-1]
+        cost = QUOTA_COSTS.get((method, resource))
+        if cost is None:
+            return self._send(404, {"error": {"code": 404, "errors": []}})
+
+        key = params.get("key", "owner")
+        if usage.get(key, 0) + cost > self.daily_quota:
+            return self._send(
+                403,
+                {
+                    "error": {
+                        "code": 403,
+                        "message": "You have exceeded your quota.",
+                        "errors": [{"reason": "quotaExceeded"}],
+                    }
+                },
+            )
+        usage[key] = usage.get(key, 0) + cost
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        handler = getattr(self, f"{method.lower()}_{resource}")
+        return self._send(200, handler(params, body))
+
+    def get_channels(self, params, body):
+        return {"items": [{"id": STAND_IN_CHANNEL_ID}]}
+
+    def get_search(self, params, body):
+        count = int(params.get("maxResults", 5))
+        return {
+            "items": [
+                {"id": {"videoId": fake_video_id(f"{params.get('q')}{i}")}}
+                for i in range(count)
+            ]
+        }
+
+    def get_videos(self, params, body):
+        items = []
+        for i, video_id in enumerate(params.get("id", "").split(",")):
+            if not video_id:
+                continue
+            items.append(
+                {
+                    "id": video_id,
+                    "contentDetails": {"duration": f"PT3M{i}S"},
+                    "statistics": {"viewCount": str(1000 * (i + 1))},
+                    "snippet": {"title": f"Video {video_id}"},
+                    "status": {
+                        "privacyStatus": "public",
+                        "uploadStatus": "processed",
+                    },
+                }
+            )
+        return {"items": items}
+
+    def get_playlistItems(self, params, body):
+        return {"items": playlists.get(params.get("playlistId"), [])}
+
+    def post_playlists(self, params, body):
+        playlist_id = f"PL{len(playlists):032d}"
+        playlists[playlist_id] = []
+        return {"id": playlist_id, "snippet": body.get("snippet", {})}
+
+    def post_playlistItems(self, params, body):
+        snippet = body["snippet"]
+        items = playlists.setdefault(snippet["playlistId"], [])
+        item = {
+            "id": f"{snippet['playlistId']}.{len(items)}",
+            "snippet": {**snippet, "position": len(items)},
+        }
+        items.append(item)
+        return item
+
+    def delete_playlistItems(self, params, body):
+        for items in playlists.values():
+            items[:] = [item for item in items if item["id"] != params.get("id")]
+        return {}
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--quota", type=int, default=10000)
+    args = parser.parse_args()
+
+    StandInHandler.daily_quota = args.quota
+    server = ThreadingHTTPServer(("localhost", args.port), StandInHandler)
+    print(f"YouTube API stand-in listening on http://localhost:{args.port}/")
+    server.serve_forever()
@@ -0,0 +1,174 @@
+"""Spread read-only YouTube Data API calls over several projects' quotas.
+
+Every Google Cloud project gets its own daily quota. Large lists need more
+playlist inserts than a single project allows, so searches and video
+lookups are served by a pool of extra API keys, leaving the signed-in
+owner's quota for the writes that must be made as them.
+"""
+
+from datetime import datetime
+from functools import lru_cache
+import hashlib
+import json
+import os
+import threading
+from zoneinfo import ZoneInfo
+
+from googleapiclient.errors import HttpError
+
+import db
+
+# Units charged per call, see https://developers.google.com/youtube/v3/determine_quota_cost
+QUOTA_COSTS = {"search": 100, "videos": 1}
+
+DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", 10000))
+
+# Quotas reset at midnight Pacific Time
+QUOTA_TIMEZONE = "America/Los_Angeles"
+
+
+@lru_cache(maxsize=None)
+def _quota_timezone():
+    # Resolved on first use so importing the app doesn't need a time zone
+    # database; on Windows it comes from the tzdata package
+    return ZoneInfo(QUOTA_TIMEZONE)
+
+
+def _quota_day():
+    return datetime.now(_quota_timezone()).date().isoformat()
+
+
+def _key_id(key):
+    # Usage is stored in the database, so never store the API key itself
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _remaining(usage, key, limit=DAILY_QUOTA):
+    used, exhausted = usage.get(_key_id(key), (0, False))
+    return 0 if exhausted else max(limit - used, 0)
+
+
+def _charge(key, units, exhausted=False):
+    db.add_quota_usage(_key_id(key), _quota_day(), units, exhausted)
+
+
+def is_quota_exceeded(error):
+    try:
+        error_content = json.loads(error.content.decode("utf-8"))
+    except (AttributeError, ValueError):
+        return False
+    errors_list = error_content.get("error", {}).get("errors", [])
+    return bool(errors_list) and errors_list[0].get("reason") == "quotaExceeded"
+
+
+def quota_exceeded_error():
+    import httplib2
+
+    content = {
+        "error": {
+            "code": 403,
+            "message": "All pooled YouTube API quotas are exhausted.",
+            "errors": [{"reason": "quotaExceeded"}],
+        }
+    }
+    return HttpError(
+        httplib2.Response({"status": 403}), json.dumps(content).encode("utf-8")
+    )
+
+
+class QuotaPool:
+    """Pick a member with quota left for each read and fail over on quotaExceeded.
+
+    ``members`` is a list of ``(key, build_service)`` pairs; reads go to the
+    member with the most quota left. ``fallback`` is only used once every
+    member is exhausted, and at most ``fallback_budget`` of its units a day
+    go to reads (None for no limit below DAILY_QUOTA).
+
+    Usage is kept in the quota_usage table, so every worker process and
+    restart sees the same counts. Services are built per thread because
+    googleapiclient services are not thread-safe.
+    """
+
+    def __init__(self, members, fallback=None, fallback_budget=None):
+        self.members = list(members)
+        self.fallback = fallback
+        self.fallback_budget = fallback_budget
+        self._local = threading.local()
+
+    def _service(self, key, build_service):
+        services = getattr(self._local, "services", None)
+        if services is None:
+            services = self._local.services = {}
+        if key not in services:
+            services[key] = build_service()
+        return services[key]
+
+    def _candidates(self, cost):
+        usage = db.get_quota_usage(_quota_day())
+        remaining = {key: _remaining(usage, key) for key, _ in self.members}
+        members = [member for member in self.members if remaining[member[0]] >= cost]
+        members.sort(key=lambda member: remaining[member[0]], reverse=True)
+
+        if self.fallback:
+            limit = DAILY_QUOTA
+            if self.fallback_budget is not None:
+                limit = min(self.fallback_budget, DAILY_QUOTA)
+            if _remaining(usage, self.fallback[0], limit) >= cost:
+                members.append(self.fallback)
+        return members
+
+    def execute(self, resource, kwargs):
+        cost = QUOTA_COSTS[resource]
+        for key, build_service in self._candidates(cost):
+            service = self._service(key, build_service)
+            try:
+                response = getattr(service, resource)().list(**kwargs).execute()
+            except HttpError as e:
+                if not is_quota_exceeded(e):
+                    _charge(key, cost)
+                    raise
+                print(f"⚠️ Quota exceeded for key {_key_id(key)[:12]}, failing over.")
+                _charge(key, 0, exhausted=True)
+                continue
+            _charge(key, cost)
+            return response
+
+        raise quota_exceeded_error()
+
+
+class _PooledRequest:
+    def __init__(self, pool, resource, kwargs):
+        self.pool = pool
+        self.resource = resource
+        self.kwargs = kwargs
+
+    def execute(self):
+        return self.pool.execute(self.resource, self.kwargs)
+
+
+class _PooledResource:
+    def __init__(self, pool, resource):
+        self.pool = pool
+        self.resource = resource
+
+    def list(self, **kwargs):
+        return _PooledRequest(self.pool, self.resource, kwargs)
+
+
+class PooledYouTube:
+    """Drop-in for a YouTube service: reads use the pool, writes the owner."""
+
+    def __init__(self, owner, pool):
+        self.owner = owner
+        self.pool = pool
+
+    def search(self):
+        return _PooledResource(self.pool, "search")
+
+    def videos(self):
+        return _PooledResource(self.pool, "videos")
+
+    def __getattr__(self, name):
+        # playlists(), playlistItems() and anything else stay pinned to the
+        # playlist owner
+        return getattr(self.owner, name)
@@ -0,0 +1,51 @@
+"""Compact records passed through the build loop, video scoring and DB layer.
+
+Each record keeps only the fields the app reads, in ``__slots__``, so the
+much larger VocaDB and YouTube response dicts can be dropped as soon as
+they have been parsed.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class ListEntry:
+    """One item of a VocaDB song list page."""
+
+    vocadb_id: int
+    order: int
+
+
+@dataclass(slots=True)
+class SongDetails:
+    """A VocaDB song with the original YouTube PVs it links to."""
+
+    vocadb_id: int
+    name: str
+    artist: str
+    length_seconds: int
+    youtube_pv_ids: list
+
+
+@dataclass(slots=True)
+class VideoCandidate:
+    video_id: str
+    duration_seconds: int
+    view_count: int
+    video_name: str
+
+
+@dataclass(slots=True)
+class SongRow:
+    """A row of the songs table, optionally joined with its playlist name."""
+
+    id: int
+    vocadb_id: int
+    playlist_id: str
+    song_name: str
+    artist_name: str
+    youtube_video_id: str
+    review_status: bool
+    original_order: int
+    suggested_video_id: str
+    playlist_name: str = None
@@ -0,0 +1,111 @@
+"""Export and import snapshots of the songs and playlists tables.
+
+A snapshot is a gzip-compressed JSON Lines file. The first line is a
+header, then each table starts with a line naming its columns, followed by
+one JSON array per row:
+
+    {"format": "vocaloid-snapshot", "version": 1}
+    {"table": "playlists", "columns": ["id", "playlist_id", ...]}
+    [1, "PLxxxx", ...]
+    {"table": "songs", "columns": ["id", "vocadb_id", ...]}
+    [1, 8394, ...]
+
+Songs carry their resolved ``youtube_video_id``, so a snapshot also moves
+video resolutions between environments. Ids are exported but ignored on
+import: playlists are matched on ``playlist_id`` and songs on their
+playlist and position, and matching rows are updated in place.
+
+Usage:
+    python snapshot.py export snapshot.jsonl.gz
+    python snapshot.py import snapshot.jsonl.gz
+"""
+
+import gzip
+import json
+import sys
+
+import db
+
+SNAPSHOT_FORMAT = "vocaloid-snapshot"
+SNAPSHOT_VERSION = 1
+
+# Parents first so songs can always be joined to their playlist
+SNAPSHOT_TABLES = ("playlists", "songs")
+
+_row_encoder = json.JSONEncoder(ensure_ascii=False, default=str)
+
+
+def export_snapshot(path, batch_size=1000):
+    counts = {}
+    with gzip.open(path, "wt", compresslevel=6, encoding="utf-8") as f:
+        f.write(json.dumps({"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION}))
+        f.write("\n")
+
+        for table in SNAPSHOT_TABLES:
+            f.write(json.dumps({"table": table, "columns": db.SNAPSHOT_COLUMNS[table]}))
+            f.write("\n")
+            counts[table] = 0
+
+            def write_rows(rows):
+                f.writelines(_row_encoder.encode(row) + "\n" for row in rows)
+                counts[table] += len(rows)
+
+            db.stream_table(table, write_rows, batch_size)
+
+    return counts
+
+
+def _read_sections(f):
+    """Yield (table, columns, rows), where rows lazily reads that table's lines."""
+    header = json.loads(f.readline())
+    if header.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError("Not a vocaloid snapshot file")
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {header.get('version')}")
+
+    pending = {"line": f.readline()}
+
+    def rows():
+        while True:
+            line = f.readline()
+            if not line or line.startswith("{"):
+                pending["line"] = line
+                return
+            yield tuple(json.loads(line))
+
+    while pending["line"]:
+        section = json.loads(pending["line"])
+        table = section["table"]
+        columns = tuple(section["columns"])
+        # Snapshots taken before a column was added simply lack it, but rows
+        # are matched on their natural key, so that must be there
+        if not set(db.SNAPSHOT_KEYS[table]) <= set(columns) or not set(
+            columns
+        ) <= set(db.SNAPSHOT_COLUMNS[table]):
+            raise ValueError(f"Snapshot columns for {table} don't match this schema")
+        pending["line"] = ""
+        yield table, columns, rows()
+
+
+def import_snapshot(path, batch_size=1000):
+    db.create_tables()
+
+    counts = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for table, columns, rows in _read_sections(f):
+            counts[table] = db.load_table(table, rows, batch_size, columns)
+
+    return counts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        print(__doc__)
+        sys.exit(1)
+
+    command, path = sys.argv[1], sys.argv[2]
+    if command == "export":
+        counts = export_snapshot(path)
+    else:
+        counts = import_snapshot(path)
+    print(", ".join(f"{table}: {count} rows" for table, count in counts.items()))
@@ -11,21 +11,24 @@ from flask import (
     stream_with_context,
     url_for,
 )
-import google.oauth2.credentials
-import google_auth_oauthlib.flow
-import googleapiclient.discovery
+from concurrent.futures import ThreadPoolExecutor
 from googleapiclient.errors import HttpError
+from functools import lru_cache
 import html
-import isodate
+import importlib
 import json
 import math
 import os
 import requests
 import random
 import re
+import threading
 import time
+from types import MappingProxyType
 
 import db
+import quota
+from records import ListEntry, SongDetails, VideoCandidate
 
 load_dotenv()
 
@@ -39,46 +42,135 @@ SCOPES = ["https://www.googleapis.com/auth/youtube"]
 API_SERVICE_NAME = "youtube"
 API_VERSION = "v3"
 
+# Extra API keys, each from its own Google Cloud project, that serve searches
+# and video lookups so the signed-in owner's quota is left for playlist writes
+YOUTUBE_API_KEYS = [
+    key.strip() for key in os.getenv("YOUTUBE_API_KEYS", "").split(",") if key.strip()
+]
+# Units of the signed-in owner's own quota that reads may use per day once
+# every key in YOUTUBE_API_KEYS is exhausted. The rest is kept for playlist
+# writes. Without API keys the owner serves all reads.
+YOUTUBE_OWNER_READ_BUDGET = int(os.getenv("YOUTUBE_OWNER_READ_BUDGET", 0))
+# Point the client at a local YouTube API stand-in, e.g. http://localhost:8765/
+YOUTUBE_API_ENDPOINT = os.getenv("YOUTUBE_API_ENDPOINT")
+
 os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
 
 DEBUG_MODE = False
 
+# Region the build searches in; the playlist audit checks availability there
+REGION_CODE = "JP"
+VIDEOS_LIST_BATCH_SIZE = 50
+AUDIT_WORKERS = 8
+
+# The Google client libraries, isodate and the MySQL driver are imported on
+# first use. Set WARM_UP=0 to skip loading them in the background at startup.
+WARM_UP = os.getenv("WARM_UP", "1") == "1"
+
+VIDEO_ID_PATTERN = re.compile(
+    r"(?:https?://)?"  # Optional scheme.
+    r"(?:www\.)?"  # Optional www.
+    r"(?:m\.)?"  # Optional mobile subdomain.
+    r"(?:youtube\.com|youtu\.be)"  # Domain.
+    r"(?:/watch\?v=|/embed/|/v/|/)"  # Different path formats.
+    r"([0-9A-Za-z_-]{11})"  # Video ID: 11 allowed characters.
+)
+
+
+@lru_cache(maxsize=None)
+def get_discovery_document():
+    """Parse the bundled YouTube discovery document once per process.
+
+    Building a resource fills in defaults on the document in place, so every
+    resource the app uses is built once here, before the document is shared
+    between threads.
+    """
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = json.loads(get_static_doc(API_SERVICE_NAME, API_VERSION))
+    youtube = build_from_document(document, developerKey="warm-up")
+    for resource in ("playlists", "playlistItems", "search", "videos"):
+        getattr(youtube, resource)()
+    return document
+
+
+def build_youtube_service(credentials=None, developer_key=None):
+    import googleapiclient.discovery
+
+    client_options = None
+    if YOUTUBE_API_ENDPOINT:
+        client_options = {"api_endpoint": YOUTUBE_API_ENDPOINT}
+    return googleapiclient.discovery.build_from_document(
+        get_discovery_document(),
+        credentials=credentials,
+        developerKey=developer_key,
+        client_options=client_options,
+    )
+
+
+def get_youtube_service_for(credentials):
+    import google.oauth2.credentials
+
+    owner_credentials = google.oauth2.credentials.Credentials(**credentials)
+
+    def build_api_key_service(api_key):
+        return lambda: build_youtube_service(developer_key=api_key)
+
+    pool = quota.QuotaPool(
+        [(api_key, build_api_key_service(api_key)) for api_key in YOUTUBE_API_KEYS],
+        fallback=(
+            credentials["client_id"],
+            lambda: build_youtube_service(credentials=owner_credentials),
+        ),
+        fallback_budget=YOUTUBE_OWNER_READ_BUDGET if YOUTUBE_API_KEYS else None,
+    )
+    return quota.PooledYouTube(
+        build_youtube_service(credentials=owner_credentials), pool
+    )
+
 
 def get_youtube_service():
     if "credentials" not in session:
         return redirect(url_for("authorize"))
-    credentials = google.oauth2.credentials.Credentials(**session["credentials"])
-    return googleapiclient.discovery.build(
-        API_SERVICE_NAME, API_VERSION, credentials=credentials
-    )
+    return get_youtube_service_for(session["credentials"])
+
+
+def get_owner_id(youtube):
+    """Return the signed-in account's channel id, which owns its playlists.
 
+    It is looked up once per sign-in in oauth2callback; this only calls the
+    API again if that lookup failed.
+    """
+    if "owner_id" not in session:
+        response = youtube.channels().list(part="id", mine=True).execute()
+        items = response.get("items", [])
+        session["owner_id"] = items[0]["id"] if items else None
+    return session["owner_id"]
 
+
+# Static playlist definitions. Build progress lives in the database and is
+# merged in per request, so these are shared read-only across threads.
 PLAYLISTS = {
     "hall_of_myths": {
         "display_name": "Hall of Myths",
         "description": "Vocaloid Songs That Have Reached 10,000,000+ Views On NicoNicoDouga",
         "list_id": 6477,
-        "current_song_number": 0,
-        "total_song_number": 0,
-        "playlist_id": 0,
     },
     "hall_of_legends": {
         "display_name": "Hall of Legends",
         "description": "Vocaloid Songs That Have Reached 1,000,000+ Views On NicoNicoDouga",
         "list_id": 30,
-        "current_song_number": 0,
-        "total_song_number": 0,
-        "playlist_id": 0,
     },
     "hall_of_fame": {
         "display_name": "Hall of Fame",
         "description": "Vocaloid Songs That Have Reached 100,000+ Views On NicoNicoDouga",
         "list_id": 186,
-        "current_song_number": 0,
-        "total_song_number": 0,
-        "playlist_id": 0,
     },
 }
+PLAYLISTS = MappingProxyType(
+    {key: MappingProxyType(playlist) for key, playlist in PLAYLISTS.items()}
+)
 
 
 def make_playlist(youtube, title):
@@ -97,7 +189,7 @@ def make_playlist(youtube, title):
         response = request.execute()
         return (True, response.get("id"))  # Always return a string on success
 
-    except googleapiclient.errors.HttpError as e:
+    except HttpError as e:
         print(e)
         error_content = json.loads(
             e.content.decode("utf-8")
@@ -121,16 +213,7 @@ def make_playlist(youtube, title):
 
 
 def extract_video_id(url):
-    pattern = (
-        r"(?:https?://)?"  # Optional scheme.
-        r"(?:www\.)?"  # Optional www.
-        r"(?:m\.)?"  # Optional mobile subdomain.
-        r"(?:youtube\.com|youtu\.be)"  # Domain.
-        r"(?:/watch\?v=|/embed/|/v/|/)"  # Different path formats.
-        r"([0-9A-Za-z_-]{11})"  # Video ID: 11 allowed characters.
-    )
-
-    match = re.search(pattern, url)
+    match = VIDEO_ID_PATTERN.search(url)
     if match:
         return match.group(1)
     return None
@@ -162,7 +245,7 @@ def search_youtube(youtube, song_title, artist=None, max_results=10):
         maxResults=max_results,
         type="video",
         order="viewCount",
-        regionCode="JP",
+        regionCode=REGION_CODE,
         relevanceLanguage="ja",
     )
     response = request.execute()
@@ -179,18 +262,20 @@ def get_video_details(youtube, video_ids):
     video_data = {}
     for item in response["items"]:
         video_id = item["id"]
-        duration = item["contentDetails"]["duration"]
-        view_count = int(item["statistics"]["viewCount"])
-        video_name = item["snippet"]["title"]
-        video_data[video_id] = {
-            "duration": duration,
-            "view_count": view_count,
-            "video_name": video_name,
-        }
+        video_data[video_id] = VideoCandidate(
+            video_id,
+            convert_duration_to_seconds(item["contentDetails"]["duration"]),
+            int(item["statistics"]["viewCount"]),
+            item["snippet"]["title"],
+        )
     return video_data
 
 
+# Durations repeat a lot (most songs are 3-5 minutes), so parse each once
+@lru_cache(maxsize=4096)
 def convert_duration_to_seconds(iso_duration):
+    import isodate
+
     duration = isodate.parse_duration(iso_duration)
     return int(duration.total_seconds())
 
@@ -199,17 +284,15 @@ def decide_on_best_video(vocadb_duration, video_data, tolerance=5):
     best_match = None
     best_score = -float("inf")
 
-    for video_id, details in video_data.items():
-        video_duration = convert_duration_to_seconds(details["duration"])
-        view_count = int(details["view_count"])
-        duration_diff = abs(video_duration - vocadb_duration)
+    for video_id, candidate in video_data.items():
+        duration_diff = abs(candidate.duration_seconds - vocadb_duration)
 
         if duration_diff <= tolerance:
             penalty_factor = 1.0
         else:
             penalty_factor = 0.5 ** ((duration_diff - tolerance) / 10.0)
 
-        score = (view_count / 1000.0) * penalty_factor
+        score = (candidate.view_count / 1000.0) * penalty_factor
 
         if score > best_score:
             best_score = score
@@ -288,41 +371,62 @@ def add_video_to_playlist(youtube, playlist_id, video_id):
     return (False, error_message)
 
 
+def get_list_page(list_id, start, max_results):
+    """Return (total_count, entries) for one page of a VocaDB song list.
+
+    Only the fields the build needs are kept, so the page response can be
+    freed before its songs are processed.
+    """
+    response = requests.get(
+        "https://vocadb.net/api/songLists/{list_id}/songs".format(list_id=list_id),
+        params={
+            "maxResults": max_results,
+            "getTotalCount": True,
+            "start": start,
+        },
+        timeout=10,
+    )
+    page = response.json()
+
+    entries = [ListEntry(item["song"]["id"], item["order"]) for item in page["items"]]
+    return page["totalCount"], entries
+
+
+def get_song_details(song_id):
+    url_get_song_by_id = f"https://vocadb.net/api/songs/{song_id}"
+    response = requests.get(url_get_song_by_id, params={"fields": "PVs"}, timeout=10)
+    data_songs_by_id = response.json()
+
+    youtube_pv_ids = [
+        extract_video_id(item["url"])
+        for item in data_songs_by_id["pvs"]
+        if item["service"] == "Youtube" and item["pvType"] == "Original"
+    ]
+    return SongDetails(
+        song_id,
+        data_songs_by_id["defaultName"],
+        data_songs_by_id["artistString"],
+        data_songs_by_id["lengthSeconds"],
+        youtube_pv_ids,
+    )
+
+
 def add_to_playlist(
     youtube, list_id, playlist_id, start=0, MAX_RESULTS=50, total_count=None
 ):
     while total_count is None or start < total_count:
-        response = requests.get(
-            "https://vocadb.net/api/songLists/{list_id}/songs".format(list_id=list_id),
-            params={
-                "maxResults": MAX_RESULTS,
-                "getTotalCount": True,
-                "start": start,
-            },
-            timeout=10,
-        )
-        data_songs_from_list = response.json()
+        page_total_count, entries = get_list_page(list_id, start, MAX_RESULTS)
 
         if total_count is None:
-            total_count = data_songs_from_list["totalCount"]
+            total_count = page_total_count
             db.update_total_song_number(total_count, playlist_id)
 
-        for song_data in data_songs_from_list["items"]:
+        for entry in entries:
             video_is_unusual = False
 
-            song_id = song_data["song"]["id"]
-            url_get_song_by_id = f"https://vocadb.net/api/songs/{song_id}"
-            response = requests.get(
-                url_get_song_by_id, params={"fields": "PVs"}, timeout=10
-            )
-            data_songs_by_id = response.json()
+            song = get_song_details(entry.vocadb_id)
 
-            youtube_video_ids_to_check, video_id_to_add = [], None
-            for item in data_songs_by_id["pvs"]:
-                if item["service"] != "Youtube" or item["pvType"] != "Original":
-                    continue
-                else:
-                    youtube_video_ids_to_check.append(extract_video_id(item["url"]))
+            youtube_video_ids_to_check, video_id_to_add = song.youtube_pv_ids, None
 
             if len(youtube_video_ids_to_check) > 1:
                 video_id_to_add = get_video_with_highest_views(
@@ -333,14 +437,12 @@ def add_to_playlist(
                 video_id_to_add = youtube_video_ids_to_check[0]
                 review_status = True
             else:
-                print(
-                    f"No Original PVs Found for: {data_songs_by_id["defaultName"]} - {data_songs_by_id["artistString"]}"
-                )
+                print(f"No Original PVs Found for: {song.name} - {song.artist}")
                 video_id_to_add = find_best_youtube_video(
                     youtube,
-                    data_songs_by_id["defaultName"],
-                    data_songs_by_id["lengthSeconds"],
-                    data_songs_by_id["artistString"],
+                    song.name,
+                    song.length_seconds,
+                    song.artist,
                 )
                 review_status = False
 
@@ -355,30 +457,30 @@ def add_to_playlist(
                     video_is_unusual = True
                     review_status = False
 
-            current_song_number = song_data["order"]
+            current_song_number = entry.order
             db.update_current_song_number(current_song_number, playlist_id)
 
             db.insert_song(
-                song_id,
+                song.vocadb_id,
                 playlist_id,
-                data_songs_by_id["defaultName"],
-                data_songs_by_id["artistString"],
+                song.name,
+                song.artist,
                 video_id_to_add,
                 review_status,
-                song_data["order"],
+                entry.order,
             )
 
             if video_id_to_add and not video_is_unusual:
                 video_details = get_video_details(youtube, [video_id_to_add])
-                video_name = video_details[video_id_to_add]["video_name"]
+                video_name = video_details[video_id_to_add].video_name
 
             if not video_id_to_add:
                 message = {
-                    "message": f"✅ No search results found for {data_songs_by_id["defaultName"]} - marked for review. ({current_song_number}/{total_count})"
+                    "message": f"✅ No search results found for {song.name} - marked for review. ({current_song_number}/{total_count})"
                 }
             elif video_is_unusual:
                 message = {
-                    "message": f"✅ Video found for {data_songs_by_id["defaultName"]} is unusual - marked for review. ({current_song_number}/{total_count})"
+                    "message": f"✅ Video found for {song.name} is unusual - marked for review. ({current_song_number}/{total_count})"
                 }
             else:
                 message = {
@@ -436,22 +538,136 @@ def replace_video_in_playlist(youtube, playlist_id, old_video_id, new_video_id):
     return insert_response
 
 
+def check_video_health(youtube, video_ids, region_code=REGION_CODE):
+    """Return {video_id: problem} for videos that can't be played in region_code.
+
+    Takes at most VIDEOS_LIST_BATCH_SIZE ids, costing a single quota unit.
+    """
+    request = youtube.videos().list(
+        part="status,contentDetails", id=",".join(video_ids)
+    )
+    response = request.execute()
+
+    problems = {video_id: "removed" for video_id in video_ids}
+    for item in response.get("items", []):
+        video_id = item["id"]
+        status = item.get("status", {})
+        restriction = item.get("contentDetails", {}).get("regionRestriction", {})
+
+        if status.get("privacyStatus") == "private":
+            problems[video_id] = "private"
+        elif status.get("uploadStatus") in ("deleted", "failed", "rejected"):
+            problems[video_id] = "removed"
+        elif region_code in restriction.get("blocked", []) or (
+            "allowed" in restriction and region_code not in restriction["allowed"]
+        ):
+            problems[video_id] = f"blocked in {region_code}"
+        else:
+            del problems[video_id]
+
+    return problems
+
+
+def find_replacement_video(youtube, song):
+    length_seconds = get_song_details(song.vocadb_id).length_seconds
+
+    search_results = search_youtube(youtube, song.song_name, song.artist_name)
+    video_ids = [
+        video["id"]["videoId"]
+        for video in search_results
+        if video["id"]["videoId"] != song.youtube_video_id
+    ]
+    if not video_ids:
+        return None
+    video_data = get_video_details(youtube, video_ids)
+    return decide_on_best_video(length_seconds, video_data)
+
+
+def audit_playlist(credentials, playlist_id, resolve_replacements=False):
+    """Check every video of a playlist and flag dead ones for review.
+
+    Batches are checked concurrently; the quota pool gives each worker thread
+    its own client since googleapiclient services are not thread-safe.
+    Replacement searches cost 100 quota units per song, so they are opt-in.
+    """
+    songs = db.get_playlist_songs(playlist_id)
+    youtube = get_youtube_service_for(credentials)
+
+    def check_batch(batch):
+        problems = check_video_health(
+            youtube, [song.youtube_video_id for song in batch]
+        )
+        return [
+            (song, problems[song.youtube_video_id])
+            for song in batch
+            if song.youtube_video_id in problems
+        ]
+
+    batches = [
+        songs[i : i + VIDEOS_LIST_BATCH_SIZE]
+        for i in range(0, len(songs), VIDEOS_LIST_BATCH_SIZE)
+    ]
+    with ThreadPoolExecutor(max_workers=AUDIT_WORKERS) as executor:
+        dead_songs = [
+            dead for found in executor.map(check_batch, batches) for dead in found
+        ]
+
+    flagged, report = [], []
+    for song, problem in dead_songs:
+        suggested_video_id = None
+        if resolve_replacements:
+            suggested_video_id = find_replacement_video(youtube, song)
+        flagged.append((song.id, suggested_video_id))
+        report.append(
+            {
+                "song_name": song.song_name,
+                "youtube_video_id": song.youtube_video_id,
+                "problem": problem,
+                "suggested_video_id": suggested_video_id,
+            }
+        )
+
+    db.flag_songs_for_review(flagged)
+
+    return {"checked": len(songs), "flagged": report}
+
+
 @app.route("/")
 def index():
     youtube = get_youtube_service()
     if isinstance(youtube, Response):
         return youtube
 
-    playlists_info = db.get_playlist_info()
+    from google.auth.exceptions import RefreshError
+
+    try:
+        owner_id = get_owner_id(youtube)
+    except (HttpError, RefreshError) as e:
+        # Show the playlists without progress rather than failing the page,
+        # e.g. when the account's daily quota is used up
+        print(f"⚠️ Could not look up the signed-in channel: {e}")
+        flash(
+            "Could not load your playlist progress, please try again later.",
+            "warning",
+        )
+        playlists_info = {}
+    else:
+        playlists_info = {
+            playlist_in_db["playlist_name"]: playlist_in_db
+            for playlist_in_db in db.get_playlist_info(owner_id)
+        }
 
-    for playlist_in_db in playlists_info:
-        for key, playlist in PLAYLISTS.items():
-            if playlist["display_name"] == playlist_in_db["playlist_name"]:
-                playlist["current_song_number"] = playlist_in_db["current_song_number"]
-                playlist["total_song_number"] = playlist_in_db["total_song_number"]
-                playlist["playlist_id"] = playlist_in_db["playlist_id"]
+    playlists = {}
+    for key, playlist in PLAYLISTS.items():
+        playlist_in_db = playlists_info.get(playlist["display_name"], {})
+        playlists[key] = {
+            **playlist,
+            "current_song_number": playlist_in_db.get("current_song_number") or 0,
+            "total_song_number": playlist_in_db.get("total_song_number") or 0,
+            "playlist_id": playlist_in_db.get("playlist_id", 0),
+        }
 
-    return render_template("index.html", playlists=PLAYLISTS)
+    return render_template("index.html", playlists=playlists)
 
 
 @app.route("/stream_playlist")
@@ -463,6 +679,15 @@ def stream_playlist():
         current_song_number = int(request.args.get("current_song_number", 0))
 
         try:
+            owner_id = get_owner_id(youtube)
+            if current_song_number != 0 and not db.is_playlist_owner(
+                playlist_id, owner_id
+            ):
+                yield "data: " + json.dumps(
+                    {"error": "This playlist belongs to another account"}
+                ) + "\n\n"
+                return
+
             if current_song_number == 0:
                 playlist_key = request.args.get("key")
                 if not playlist_key or playlist_key not in PLAYLISTS:
@@ -487,6 +712,7 @@ def stream_playlist():
                     playlist_id,
                     playlist_data["display_name"],
                     playlist_data["description"],
+                    owner_id,
                 )
 
                 yield "data: " + json.dumps(
@@ -507,7 +733,7 @@ def stream_playlist():
                 }
             ) + "\n\n"
 
-        except googleapiclient.errors.HttpError as e:
+        except HttpError as e:
             playlist_url = f"https://www.youtube.com/playlist?list={playlist_id}"
             yield "data: " + json.dumps(
                 {
@@ -539,7 +765,7 @@ def update_video():
     youtube_video_id_new = extract_video_id(youtube_video_URL)
 
     video_details = get_video_details(youtube, [youtube_video_id_new])
-    new_video_name = video_details[youtube_video_id_new]["video_name"]
+    new_video_name = video_details[youtube_video_id_new].video_name
 
     if youtube_video_id_old == "None":
         add_video_to_playlist(youtube, playlist_id, youtube_video_id_new)
@@ -557,6 +783,44 @@ def update_video():
     )
 
 
+@app.route("/audit_playlist")
+def audit_playlist_route():
+    if "credentials" not in session:
+        return jsonify({"error": "Please log in again to audit playlists."}), 401
+    playlist_id = request.args.get("playlist_id")
+    resolve_replacements = request.args.get("resolve_replacements") == "true"
+    from google.auth.exceptions import RefreshError
+
+    try:
+        owner_id = get_owner_id(get_youtube_service_for(session["credentials"]))
+        if not db.is_playlist_owner(playlist_id, owner_id):
+            return (
+                jsonify({"error": "🚨 This playlist belongs to another account."}),
+                403,
+            )
+
+        result = audit_playlist(
+            session["credentials"], playlist_id, resolve_replacements
+        )
+    except RefreshError:
+        return jsonify({"error": "Please log in again to audit playlists."}), 401
+    except HttpError as e:
+        print(e)
+        error_message = f"Error auditing playlist: {e.reason}"
+        if quota.is_quota_exceeded(e):
+            error_message = (
+                "YouTube Data API Quota Limit Exceeded - Please Try Again Later"
+            )
+        return jsonify({"error": "🚨 " + error_message}), e.resp.status
+
+    return jsonify(
+        {
+            "success": f"Audited {result['checked']} songs, {len(result['flagged'])} flagged for review.",
+            "flagged": result["flagged"],
+        }
+    )
+
+
 @app.route("/mark_reviewed")
 def mark_reviewed():
     song_id = request.args.get("song_id")
@@ -567,6 +831,8 @@ def mark_reviewed():
 
 @app.route("/authorize")
 def authorize():
+    import google_auth_oauthlib.flow
+
     flow = google_auth_oauthlib.flow.Flow.from_client_secrets_file(
         CLIENT_SECRETS_FILE, scopes=SCOPES
     )
@@ -583,6 +849,8 @@ def authorize():
 
 @app.route("/oauth2callback")
 def oauth2callback():
+    import google_auth_oauthlib.flow
+
     state = session.get("state")
 
     flow = google_auth_oauthlib.flow.Flow.from_client_secrets_file(
@@ -602,6 +870,15 @@ def oauth2callback():
         "scopes": credentials.scopes,
     }
 
+    # Look the channel up once per sign-in; index retries if this fails
+    session.pop("owner_id", None)
+    from google.auth.exceptions import RefreshError
+
+    try:
+        get_owner_id(get_youtube_service_for(session["credentials"]))
+    except (HttpError, RefreshError) as e:
+        print(f"⚠️ Could not look up the signed-in channel: {e}")
+
     return redirect(url_for("index"))
 
 
@@ -611,6 +888,93 @@ def logout():
     return redirect(url_for("index"))
 
 
+# Modules imported by the warm-up so the first sign-in and build don't pay
+# for them
+WARM_UP_MODULES = (
+    "google.oauth2.credentials",
+    "google_auth_oauthlib.flow",
+    "googleapiclient.discovery",
+    "isodate",
+)
+
+# Start-up state of the current process. Nothing is started at import, and a
+# worker forked from a preloading parent (gunicorn --preload) gets fresh
+# state instead of waiting on an event only the parent would set.
+_startup = {"pid": None}
+_startup_lock = threading.Lock()
+
+
+def _process_startup():
+    with _startup_lock:
+        if _startup["pid"] != os.getpid():
+            _startup.update(
+                pid=os.getpid(),
+                lock=threading.Lock(),
+                tables_ready=threading.Event(),
+                thread=None,
+            )
+        return _startup
+
+
+def warm_up(tables_ready):
+    """Do the slow first-use work before the first requests need it."""
+    started = time.perf_counter()
+    if not tables_ready.is_set():
+        try:
+            db.warm_up()
+        except Exception as e:
+            print(f"⚠️ Database warm-up failed: {e}")
+        finally:
+            tables_ready.set()
+
+    for module in WARM_UP_MODULES:
+        importlib.import_module(module)
+
+    get_discovery_document()
+    convert_duration_to_seconds("PT0S")
+    print(f"✅ Warm-up finished in {time.perf_counter() - started:.2f}s")
+
+
+def start_warm_up():
+    """Start the background warm-up, at most once per process.
+
+    Call it from the process entry point, or from gunicorn's post_fork hook
+    when the app is preloaded, so it runs before the first request.
+    """
+    startup = _process_startup()
+    with startup["lock"]:
+        if startup["thread"] is None:
+            startup["thread"] = threading.Thread(
+                target=warm_up,
+                args=(startup["tables_ready"],),
+                name="warm-up",
+                daemon=True,
+            )
+            startup["thread"].start()
+        return startup["thread"]
+
+
+@app.before_request
+def wait_for_tables():
+    startup = _process_startup()
+    tables_ready = startup["tables_ready"]
+    if tables_ready.is_set():
+        return
+
+    if startup["thread"] is not None:
+        tables_ready.wait(timeout=30)
+        return
+
+    # No warm-up is running in this process, so create the tables here
+    with startup["lock"]:
+        if not tables_ready.is_set():
+            db.create_tables()
+            tables_ready.set()
+    if WARM_UP:
+        start_warm_up()
+
+
 if __name__ == "__main__":
-    db.create_tables()
+    if WARM_UP:
+        start_warm_up()
     app.run("localhost", 8080, debug=True)